@@ -3,7 +3,11 @@
 
 from trytond.pool import Pool
 from .delivery import *
+from .archive import *
+from .summary import *
 from .move import *
+from .party import *
+from .trace import *
 from .shop import *
 
 def register():
@@ -11,12 +15,24 @@ def register():
         Delivery,
         DeliveryLine,
         DeliveryLineTax,
+        DeliveryArchive,
+        DeliveryLineArchive,
+        DeliveryLineArchiveTax,
+        DeliverySummary,
+        DeliveryPartyBalance,
+        Party,
+        DeliveryTraceStart,
+        DeliveryTraceLine,
+        DeliveryTraceResult,
         Move,
         SaleShop,
         module='nodux_sale_delivery_note', type_='model')
     Pool.register(
         ValidatedInvoice,
+        DeliverySummaryRebuild,
+        DeliveryTrace,
         module='nodux_sale_delivery_note', type_='wizard')
     Pool.register(
         DeliveryNoteReport,
+        DeliveryArchiveReport,
         module='nodux_sale_delivery_note', type_='report')
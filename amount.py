@@ -0,0 +1,104 @@
+# This file is part of sale_pos module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+'''
+Compute line amounts and totals in integer minor units.
+
+The results are identical to rounding Decimal(str(quantity)) * unit_price
+with currency.round (ROUND_HALF_EVEN) but avoid building and quantizing a
+Decimal for each line.
+'''
+from decimal import Decimal
+
+__all__ = ['minor_rounding', 'line_amounts', 'sum_amounts', 'from_minor']
+
+
+def _scaled(value):
+    'Return (integer, exponent) such that value == integer * 10 ** -exponent'
+    sign, digits, exponent = value.as_tuple()
+    integer = 0
+    for digit in digits:
+        integer = integer * 10 + digit
+    if sign:
+        integer = -integer
+    if exponent > 0:
+        return integer * 10 ** exponent, 0
+    return integer, -exponent
+
+
+def _scaled_text(text):
+    'Return the scaled integer of the number in text'
+    if 'e' in text or 'E' in text:
+        return _scaled(Decimal(text))
+    integer, _, fraction = text.partition('.')
+    return int(integer + fraction), len(fraction)
+
+
+class _Powers(dict):
+    'Cache of the powers of ten'
+
+    def __missing__(self, exponent):
+        value = self[exponent] = 10 ** exponent
+        return value
+
+
+def minor_rounding(rounding):
+    '''
+    Return the (step, exponent) of a currency rounding where step is the
+    rounding in minor units of 10 ** -exponent.
+    '''
+    return _scaled(rounding)
+
+
+def line_amounts(quantities, unit_prices, roundings):
+    '''
+    Return the amounts in minor units of the flat sequences of quantities
+    (float), unit prices (Decimal) and roundings (from minor_rounding).
+    '''
+    # Decimal hashing is slow, so prices are cached by their text
+    quantities_scaled = {None: (0, 0)}
+    prices_scaled = {'None': (0, 0)}
+    powers = _Powers()
+    amounts = []
+    append = amounts.append
+    for quantity, unit_price, (step, exponent) in zip(quantities,
+            unit_prices, roundings):
+        try:
+            q_int, q_exp = quantities_scaled[quantity]
+        except KeyError:
+            q_int, q_exp = quantities_scaled[quantity] = _scaled_text(
+                str(quantity))
+        text = str(unit_price)
+        try:
+            p_int, p_exp = prices_scaled[text]
+        except KeyError:
+            p_int, p_exp = prices_scaled[text] = _scaled_text(text)
+        # amount / rounding = q_int * p_int * 10 ** exponent
+        #     / (step * 10 ** (q_exp + p_exp))
+        numerator = q_int * p_int
+        shift = exponent - q_exp - p_exp
+        if shift >= 0:
+            numerator *= powers[shift]
+            denominator = step
+        else:
+            denominator = step * powers[-shift]
+        quotient, remainder = divmod(numerator, denominator)
+        remainder *= 2
+        if remainder > denominator or (remainder == denominator
+                and quotient % 2):
+            quotient += 1
+        append(quotient * step)
+    return amounts
+
+
+def sum_amounts(keys, amounts):
+    'Return the sum of amounts grouped by the parallel keys'
+    totals = {}
+    for key, amount in zip(keys, amounts):
+        totals[key] = totals.get(key, 0) + amount
+    return totals
+
+
+def from_minor(amount, exponent):
+    'Return the Decimal of amount in minor units of 10 ** -exponent'
+    return Decimal(amount).scaleb(-exponent)
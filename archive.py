@@ -0,0 +1,212 @@
+# This file is part of sale_pos module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.pool import Pool
+from trytond.pyson import Eval
+
+from .delivery import DeliveryNoteReport, conversor
+
+__all__ = ['DeliveryArchive', 'DeliveryLineArchive', 'DeliveryLineArchiveTax',
+    'DeliveryArchiveReport']
+
+
+class DeliveryArchive(ModelSQL, ModelView):
+    'Delivery Archive'
+    __name__ = 'sale.delivery_archive'
+    _rec_name = 'number'
+
+    delivery_id = fields.Integer('Delivery ID', readonly=True, select=True,
+        help="Identifier of the archived delivery note")
+    delivery_create_uid = fields.Many2One('res.user', 'Created by',
+        readonly=True, help="User who created the archived delivery note")
+    delivery_create_date = fields.DateTime('Created on', readonly=True,
+        help="Creation date of the archived delivery note")
+    company = fields.Many2One('company.company', 'Company', readonly=True,
+        select=True)
+    state = fields.Selection([
+        ('anulled', 'Anulled'),
+        ('invoiced', 'Invoiced'),
+    ], 'State', readonly=True)
+    number = fields.Char('Number', readonly=True, help="Delivery Note Number")
+    delivery_date = fields.Date('Date', readonly=True, select=True)
+    party = fields.Many2One('party.party', 'Party', readonly=True, select=True)
+    shop = fields.Many2One('sale.shop', 'Shop', readonly=True)
+    warehouse = fields.Many2One('stock.location', 'Warehouse', readonly=True)
+    currency = fields.Many2One('currency.currency', 'Currency', readonly=True)
+    currency_digits = fields.Function(fields.Integer('Currency Digits'),
+        'on_change_with_currency_digits')
+    lines = fields.One2Many('sale.delivery_line_archive', 'delivery', 'Lines',
+        readonly=True)
+    comment = fields.Text('Comment', readonly=True)
+    untaxed_amount = fields.Numeric('Untaxed',
+        digits=(16, Eval('currency_digits', 2)), readonly=True,
+        depends=['currency_digits'])
+    tax_amount = fields.Numeric('Tax',
+        digits=(16, Eval('currency_digits', 2)), readonly=True,
+        depends=['currency_digits'])
+    total_amount = fields.Numeric('Total',
+        digits=(16, Eval('currency_digits', 2)), readonly=True,
+        depends=['currency_digits'])
+
+    @classmethod
+    def __setup__(cls):
+        super(DeliveryArchive, cls).__setup__()
+        cls._order.insert(0, ('delivery_date', 'DESC'))
+
+    @fields.depends('currency')
+    def on_change_with_currency_digits(self, name=None):
+        if self.currency:
+            return self.currency.digits
+        return 2
+
+    def get_amount2words(self, value):
+        if conversor:
+            return (conversor.cardinal(int(value))).upper()
+        return ''
+
+    @classmethod
+    def _get_archive_values(cls, delivery):
+        'Return the values to create the archive of delivery'
+        Line = Pool().get('sale.delivery_line_archive')
+        return {
+            'delivery_id': delivery.id,
+            'delivery_create_uid': (delivery.create_uid.id
+                if delivery.create_uid else None),
+            'delivery_create_date': delivery.create_date,
+            'company': delivery.company.id,
+            'state': delivery.state,
+            'number': delivery.number,
+            'delivery_date': delivery.delivery_date,
+            'party': delivery.party.id,
+            'shop': delivery.shop.id if delivery.shop else None,
+            'warehouse': (delivery.warehouse.id
+                if delivery.warehouse else None),
+            'currency': delivery.currency.id,
+            'comment': delivery.comment,
+            'untaxed_amount': delivery.untaxed_amount,
+            'tax_amount': delivery.tax_amount,
+            'total_amount': delivery.total_amount,
+            'lines': [('create', [Line._get_archive_values(l)
+                        for l in delivery.lines])],
+            }
+
+    @classmethod
+    def archive(cls, deliveries):
+        '''
+        Copy deliveries with their lines and taxes to the archive, point
+        their stock moves to the archived lines and delete them.
+        '''
+        pool = Pool()
+        Delivery = pool.get('sale.delivery')
+        Move = pool.get('stock.move')
+
+        if not deliveries:
+            return []
+        archives = cls.create([cls._get_archive_values(d)
+                for d in deliveries])
+
+        line_ids = [l.id for d in deliveries for l in d.lines]
+        moves = Move.search([
+                ('origin', 'in', ['sale.delivery_line,%s' % i
+                        for i in line_ids]),
+                ])
+        archive_lines = dict((l.line_id, l)
+            for a in archives for l in a.lines)
+        origins = {}
+        for move in moves:
+            origins.setdefault(move.origin.id, []).append(move)
+        to_write = []
+        for line_id, line_moves in origins.iteritems():
+            to_write.extend((line_moves, {
+                        'origin': str(archive_lines[line_id]),
+                        }))
+        if to_write:
+            Move.write(*to_write)
+
+        Delivery.delete(deliveries)
+        return archives
+
+
+class DeliveryLineArchive(ModelSQL, ModelView):
+    'Delivery Line Archive'
+    __name__ = 'sale.delivery_line_archive'
+    _rec_name = 'description'
+
+    line_id = fields.Integer('Line ID', readonly=True,
+        help="Identifier of the archived delivery line")
+    delivery = fields.Many2One('sale.delivery_archive', 'Delivery',
+        ondelete='CASCADE', select=True, readonly=True)
+    sequence = fields.Integer('Sequence', readonly=True)
+    type = fields.Selection([
+        ('line', 'Line'),
+        ], 'Type', readonly=True)
+    quantity = fields.Float('Quantity', digits=(16, Eval('unit_digits', 2)),
+        readonly=True, depends=['unit_digits'])
+    unit = fields.Many2One('product.uom', 'Unit', readonly=True)
+    unit_digits = fields.Function(fields.Integer('Unit Digits'),
+        'on_change_with_unit_digits')
+    product = fields.Many2One('product.product', 'Product', readonly=True,
+        select=True)
+    unit_price = fields.Numeric('Unit Price', digits=(16, 4), readonly=True)
+    amount = fields.Numeric('Amount',
+        digits=(16, Eval('_parent_delivery', {}).get('currency_digits', 2)),
+        readonly=True)
+    description = fields.Text('Description', size=None, readonly=True)
+    note = fields.Text('Note', readonly=True)
+    taxs = fields.Many2Many('sale.delivery_line_archive-account.tax',
+        'line', 'tax', 'Taxes', readonly=True)
+    lot = fields.Many2One('stock.lot', 'Lot', readonly=True, select=True)
+    moves = fields.One2Many('stock.move', 'origin', 'Moves', readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(DeliveryLineArchive, cls).__setup__()
+        cls._order.insert(0, ('sequence', 'ASC'))
+
+    @staticmethod
+    def order_sequence(tables):
+        table, _ = tables[None]
+        return [table.sequence == None, table.sequence]
+
+    @fields.depends('unit')
+    def on_change_with_unit_digits(self, name=None):
+        if self.unit:
+            return self.unit.digits
+        return 2
+
+    @classmethod
+    def _get_archive_values(cls, line):
+        'Return the values to create the archive of line'
+        return {
+            'line_id': line.id,
+            'sequence': line.sequence,
+            'type': line.type,
+            'quantity': line.quantity,
+            'unit': line.unit.id if line.unit else None,
+            'product': line.product.id if line.product else None,
+            'unit_price': line.unit_price,
+            'amount': line.amount,
+            'description': line.description,
+            'note': line.note,
+            'taxs': [('add', [t.id for t in line.taxs])],
+            'lot': line.lot.id if line.lot else None,
+            }
+
+
+class DeliveryLineArchiveTax(ModelSQL):
+    'Delivery Line Archive - Tax'
+    __name__ = 'sale.delivery_line_archive-account.tax'
+    _table = 'delivery_line_archive_account_tax'
+    line = fields.Many2One('sale.delivery_line_archive', 'Delivery Line',
+        ondelete='CASCADE', select=True, required=True)
+    tax = fields.Many2One('account.tax', 'Tax', ondelete='RESTRICT',
+        select=True, required=True)
+
+
+class DeliveryArchiveReport(DeliveryNoteReport):
+    __name__ = 'sale.delivery_archive_report'
+
+    @classmethod
+    def _get_seller(cls, delivery):
+        return delivery.delivery_create_uid or delivery.create_uid
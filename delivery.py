@@ -2,7 +2,18 @@
 # The COPYRIGHT file at the top level of this repository contains
 # the full copyright notices and license terms.
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import wraps
+from io import BytesIO
+import logging
+import threading
+import time
+from sql import Column, Literal, Union
+from sql.aggregate import Count, Min
+from sql.operators import Concat, Exists
+
+from trytond import backend
+from trytond.config import config
 from trytond.model import ModelView, fields, ModelSQL, Workflow
 from trytond.pool import PoolMeta, Pool
 from trytond.transaction import Transaction
@@ -12,12 +23,66 @@ from trytond.wizard import (Wizard, StateView, StateAction, StateTransition,
 from trytond.modules.company import CompanyReport
 from trytond.report import Report
 
+from .amount import minor_rounding, line_amounts, sum_amounts, from_minor
+from .report_worker import render_reports
+from . import instrumentation
+from .instrumentation import instrument
+
 __all__ = ['Delivery', 'DeliveryLine', 'DeliveryLineTax', 'ValidatedInvoice',
 'DeliveryNoteReport']
 __metaclass__ = PoolMeta
 
 _ZERO = Decimal(0)
 
+logger = logging.getLogger(__name__)
+
+_lock_statistics = {
+    'calls': 0,
+    'contended': 0,
+    'serialization_failures': 0,
+    'wait': 0.0,
+    'max_wait': 0.0,
+    }
+_lock_statistics_lock = threading.Lock()
+
+
+def create_index(cursor, name, table, definition, unique=False):
+    'Create the PostgreSQL index name on table if it does not exist'
+    cursor.execute('SELECT 1 FROM pg_indexes WHERE indexname = %s', (name,))
+    if not cursor.fetchone():
+        cursor.execute('CREATE %sINDEX "%s" ON "%s" %s' % (
+                'UNIQUE ' if unique else '', name, table, definition))
+
+
+def insert_or_retry(cursor, query):
+    '''
+    Execute the insert query and turn a unique violation into an
+    operational error, so the request is retried by the dispatcher and
+    updates the row inserted by the concurrent transaction.
+    '''
+    DatabaseIntegrityError = backend.get('DatabaseIntegrityError')
+    DatabaseOperationalError = backend.get('DatabaseOperationalError')
+    try:
+        cursor.execute(*query)
+    except DatabaseIntegrityError as exception:
+        raise DatabaseOperationalError(str(exception))
+
+
+def has_trigram(cursor):
+    'Return if the pg_trgm extension is installed'
+    cursor.execute('SELECT 1 FROM pg_extension WHERE extname = %s',
+        ('pg_trgm',))
+    return bool(cursor.fetchone())
+
+
+def locked(func):
+    'Lock the deliveries before calling func'
+    @wraps(func)
+    def wrapper(cls, deliveries, *args, **kwargs):
+        deliveries = cls.lock(deliveries)
+        return func(cls, deliveries, *args, **kwargs)
+    return wrapper
+
 conversor = None
 try:
     from numword import numword_es
@@ -26,10 +91,16 @@ except:
     print("Warning: Does not possible import numword module!")
     print("Please install it...!")
 
+try:
+    from PyPDF2 import PdfFileMerger
+except ImportError:
+    PdfFileMerger = None
+
 
-class Delivery(ModelSQL, ModelView):
+class Delivery(Workflow, ModelSQL, ModelView):
     'Delivery'
     __name__ = 'sale.delivery'
+    _rec_name = 'number'
 
     company = fields.Many2One('company.company', 'Company', required=True,
         states={
@@ -64,6 +135,7 @@ class Delivery(ModelSQL, ModelView):
         depends=['state'])
     party_lang = fields.Function(fields.Char('Party Language'),
         'on_change_with_party_lang')
+    shop = fields.Many2One('sale.shop', 'Shop', readonly=True, select=True)
     warehouse = fields.Many2One('stock.location', 'Warehouse',
         domain=[('type', '=', 'warehouse')], states={
             'readonly': Eval('state') != 'draft',
@@ -112,6 +184,16 @@ class Delivery(ModelSQL, ModelView):
         super(Delivery, cls).__setup__()
 
         cls._states_cached = ['invoiced', 'anulled']
+        cls._transitions |= set((
+                ('draft', 'saved'),
+                ('saved', 'invoiced'),
+                ('saved', 'anulled'),
+                ))
+        cls._sql_constraints += [
+            # The numbers come from the sequence of each shop
+            ('number_shop_uniq', 'UNIQUE(company, number, shop)',
+                'The number of the delivery note must be unique per shop.'),
+            ]
 
         cls._buttons.update({
                 'consolidate': {
@@ -122,8 +204,50 @@ class Delivery(ModelSQL, ModelView):
                     'invisible': Eval('state').in_(['saved', 'invoiced', 'anulled']),
                     },
 
+                'anull': {
+                    'invisible': Eval('state') != 'saved',
+                    },
+
                 })
 
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+
+        super(Delivery, cls).__register__(module_name)
+
+        table = TableHandler(cursor, cls, module_name)
+        table.index_action(['company', 'state', 'delivery_date'], 'add')
+        table.index_action(['party', 'state'], 'add')
+
+        # Set the shop of the notes numbered before it was stored, when
+        # their warehouse has a single shop and their number is not
+        # repeated, so number_shop_uniq applies to them
+        Shop = Pool().get('sale.shop')
+        sql_table = cls.__table__()
+        other = cls.__table__()
+        shop = Shop.__table__()
+        cursor.execute(*sql_table.update([sql_table.shop],
+                [shop.select(Min(shop.id),
+                        where=(shop.warehouse == sql_table.warehouse)
+                        & (shop.company == sql_table.company),
+                        having=Count(shop.id) == 1)],
+                where=(sql_table.shop == None) & (sql_table.number != None)
+                & ~Exists(other.select(other.id,
+                        where=(other.company == sql_table.company)
+                        & (other.number == sql_table.number)
+                        & (other.id != sql_table.id)))))
+
+        if backend.name() == 'postgresql':
+            # Prefix LIKE only uses a btree index with a pattern operator
+            # class when the collation is not C
+            create_index(cursor, cls._table + '_number_pattern_index',
+                cls._table, '(number varchar_pattern_ops)')
+            if has_trigram(cursor):
+                create_index(cursor, cls._table + '_number_trgm_index',
+                    cls._table, 'USING gin (number gin_trgm_ops)')
+
     @classmethod
     def default_warehouse(cls):
         Location = Pool().get('stock.location')
@@ -134,6 +258,10 @@ class Delivery(ModelSQL, ModelView):
     def default_company():
         return Transaction().context.get('company')
 
+    @staticmethod
+    def default_shop():
+        return Transaction().context.get('shop')
+
     @staticmethod
     def default_state():
         return 'draft'
@@ -169,6 +297,40 @@ class Delivery(ModelSQL, ModelView):
             res['language'] = self.party.lang.code
         return res
 
+    def get_rec_name(self, name):
+        return self.number or str(self.id)
+
+    @classmethod
+    def search_rec_name(cls, name, clause):
+        '''
+        Search digits as a number prefix, an unpadded number or a substring
+        of the number, and any other text as a substring of the number or
+        party name. The prefix and exact matches use the number btree
+        indexes and the substrings the trigram indexes when pg_trgm is
+        installed.
+        '''
+        _, operator, value = clause
+        if (operator not in ('like', 'ilike')
+                or not isinstance(value, basestring)):
+            return [('number',) + tuple(clause[1:])]
+        text = value.strip('%')
+        if not text or '%' in text or '_' in text:
+            return ['OR',
+                ('number',) + tuple(clause[1:]),
+                ('party.name',) + tuple(clause[1:]),
+                ]
+        pattern = '%' + text + '%'
+        if text.isdigit():
+            return ['OR',
+                ('number', 'like', text + '%'),
+                ('number', '=', text.zfill(9)),
+                ('number', 'ilike', pattern),
+                ]
+        return ['OR',
+            ('number', 'ilike', pattern),
+            ('party.name', 'ilike', pattern),
+            ]
+
     @fields.depends('party')
     def on_change_with_party_lang(self, name=None):
         Config = Pool().get('ir.configuration')
@@ -177,6 +339,8 @@ class Delivery(ModelSQL, ModelView):
         return Config.get_language()
 
     @fields.depends('lines', 'currency', 'party')
+    @instrument('Delivery.on_change_lines',
+        lambda self: len(getattr(self, 'lines', None) or []))
     def on_change_lines(self):
         pool = Pool()
         Tax = pool.get('account.tax')
@@ -273,46 +437,82 @@ class Delivery(ModelSQL, ModelView):
 
     @classmethod
     def get_amount(cls, sales, names):
-        untaxed_amount = {}
-        tax_amount = {}
-        total_amount = {}
-
-        if {'tax_amount', 'total_amount'} & set(names):
-            compute_taxes = True
-        else:
-            compute_taxes = False
-        # Sort cached first and re-instanciate to optimize cache management
-        sales = sorted(sales, key=lambda s: s.state in cls._states_cached,
-            reverse=True)
-        sales = cls.browse(sales)
-        for sale in sales:
-            if (sale.state in cls._states_cached
-                    and sale.untaxed_amount_cache is not None
-                    and sale.tax_amount_cache is not None
-                    and sale.total_amount_cache is not None):
-                untaxed_amount[sale.id] = sale.untaxed_amount_cache
-                if compute_taxes:
-                    tax_amount[sale.id] = sale.tax_amount_cache
-                    total_amount[sale.id] = sale.total_amount_cache
+        # Function getters must keep their signature, Tryton inspects it
+        with instrumentation.measure('Delivery.get_amount', len(sales)):
+            untaxed_amount = {}
+            tax_amount = {}
+            total_amount = {}
+
+            if {'tax_amount', 'total_amount'} & set(names):
+                compute_taxes = True
             else:
-                untaxed_amount[sale.id] = sum(
-                    (line.amount for line in sale.lines
-                        if line.type == 'line'), _ZERO)
-                if compute_taxes:
+                compute_taxes = False
+            # Sort cached first and re-instanciate to optimize cache management
+            sales = sorted(sales, key=lambda s: s.state in cls._states_cached,
+                reverse=True)
+            sales = cls.browse(sales)
+            to_compute = []
+            for sale in sales:
+                if (sale.state in cls._states_cached
+                        and sale.untaxed_amount_cache is not None
+                        and sale.tax_amount_cache is not None
+                        and sale.total_amount_cache is not None):
+                    untaxed_amount[sale.id] = sale.untaxed_amount_cache
+                    if compute_taxes:
+                        tax_amount[sale.id] = sale.tax_amount_cache
+                        total_amount[sale.id] = sale.total_amount_cache
+                else:
+                    to_compute.append(sale)
+            untaxed_amount.update(cls.get_untaxed_amounts(to_compute))
+            if compute_taxes:
+                for sale in to_compute:
                     tax_amount[sale.id] = sale.get_tax_amount()
                     total_amount[sale.id] = (
                         untaxed_amount[sale.id] + tax_amount[sale.id])
 
-        result = {
-            'untaxed_amount': untaxed_amount,
-            'tax_amount': tax_amount,
-            'total_amount': total_amount,
-            }
-        for key in result.keys():
-            if key not in names:
-                del result[key]
-        return result
+            result = {
+                'untaxed_amount': untaxed_amount,
+                'tax_amount': tax_amount,
+                'total_amount': total_amount,
+                }
+            for key in result.keys():
+                if key not in names:
+                    del result[key]
+            return result
+
+
+    @classmethod
+    def get_untaxed_amounts(cls, sales):
+        '''
+        Return the untaxed amount of sales computed in integer minor units
+        from the quantities and unit prices of their lines.
+        '''
+        Line = Pool().get('sale.delivery_line')
+        line = Line.__table__()
+        cursor = Transaction().cursor
 
+        result = {}
+        roundings = {}
+        for sale in sales:
+            result[sale.id] = _ZERO
+            roundings[sale.id] = minor_rounding(sale.currency.rounding)
+        deliveries, quantities, unit_prices = [], [], []
+        ids = list(roundings)
+        for i in range(0, len(ids), cursor.IN_MAX):
+            sub_ids = ids[i:i + cursor.IN_MAX]
+            cursor.execute(*line.select(line.delivery, line.quantity,
+                    line.unit_price,
+                    where=line.delivery.in_(sub_ids)
+                    & (line.type == 'line')))
+            for delivery, quantity, unit_price in cursor.fetchall():
+                deliveries.append(delivery)
+                quantities.append(quantity)
+                unit_prices.append(unit_price)
+        amounts = line_amounts(quantities, unit_prices,
+            [roundings[d] for d in deliveries])
+        for delivery, amount in sum_amounts(deliveries, amounts).iteritems():
+            result[delivery] = from_minor(amount, roundings[delivery][1])
+        return result
 
     def get_shipments_returns(model_name):
         def method(self, name):
@@ -345,7 +545,12 @@ class Delivery(ModelSQL, ModelView):
         sequence_delivery_note = None
         pool = Pool()
         Shop = Pool().get('sale.shop')
-        shop = Shop(Transaction().context.get('shop'))
+        shop = self.shop
+        if not shop and Transaction().context.get('shop'):
+            shop = Shop(Transaction().context['shop'])
+        if not shop:
+            self.raise_user_error('Se requiere la tienda de la Nota de '
+                'Entrega para asignar su numero')
 
         if shop.sequence_delivery_note:
             sequence_delivery_note = shop.sequence_delivery_note
@@ -371,52 +576,203 @@ class Delivery(ModelSQL, ModelView):
                 number = +str(sequence_delivery_note)
             shop.sequence_delivery_note = sequence_delivery_note + 1
             shop.save()
-        vals = {'number': number}
+        vals = {'number': number, 'shop': shop.id}
         self.write([self], vals)
 
     @classmethod
+    def lock(cls, deliveries):
+        '''
+        Lock the rows of deliveries until the end of the transaction and
+        return them re-instanciated.
+        Under REPEATABLE READ the snapshot is taken before the lock, so a
+        transaction that waited for a concurrent update of the rows fails
+        with a serialization error. The dispatcher retries the request
+        and the transitions then skip the notes already processed.
+        The waits longer than lock_wait_threshold seconds of the
+        sale_delivery configuration section are counted as contended and
+        the serialization errors as serialization_failures.
+        '''
+        DatabaseOperationalError = backend.get('DatabaseOperationalError')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        ids = sorted(set(d.id for d in deliveries))
+        if backend.name() != 'postgresql' or not ids:
+            return cls.browse(ids)
+        threshold = config.getfloat('sale_delivery', 'lock_wait_threshold',
+            default=0.01)
+        serialization_failure = False
+        start = time.time()
+        try:
+            for i in range(0, len(ids), cursor.IN_MAX):
+                sub_ids = ids[i:i + cursor.IN_MAX]
+                query, params = tuple(table.select(table.id,
+                        where=table.id.in_(sub_ids),
+                        order_by=table.id.asc))
+                cursor.execute(query + ' FOR UPDATE', params)
+        except DatabaseOperationalError as exception:
+            # 40001 is serialization_failure
+            serialization_failure = (
+                getattr(exception, 'pgcode', None) == '40001')
+            raise
+        finally:
+            wait = time.time() - start
+            with _lock_statistics_lock:
+                _lock_statistics['calls'] += 1
+                _lock_statistics['wait'] += wait
+                _lock_statistics['max_wait'] = max(
+                    _lock_statistics['max_wait'], wait)
+                if wait > threshold:
+                    _lock_statistics['contended'] += 1
+                if serialization_failure:
+                    _lock_statistics['serialization_failures'] += 1
+            if wait > threshold:
+                logger.info('waited %.3fs to lock delivery notes %s', wait,
+                    ids)
+        return cls.browse(ids)
+
+    @staticmethod
+    def lock_statistics():
+        'Return the lock counters of this process'
+        with _lock_statistics_lock:
+            return dict(_lock_statistics)
+
+    @classmethod
+    def dump_instrumentation(cls, filename=None):
+        '''
+        Dump the instrumentation statistics and the lock counters of this
+        process to filename, instrument_dump or the log.
+        '''
+        filename = filename or config.get('sale_delivery', 'instrument_dump',
+            default=None)
+        instrumentation.dump(filename)
+        logger.info('delivery note locks: %s', cls.lock_statistics())
+
+    @classmethod
+    @instrument('Delivery.save', lambda cls, sales: len(sales))
     @ModelView.button
+    @locked
+    @Workflow.transition('saved')
     def save(cls, sales):
-        Line = Pool().get('sale.delivery_line')
-        sale = sales[0]
+        pool = Pool()
+        Summary = pool.get('sale.delivery_summary')
+        Balance = pool.get('sale.delivery_party_balance')
+        Move = pool.get('stock.move')
         shipment_type = 'out'
-        sale.create_shipment(shipment_type)
-        sale.set_number()
-        cls.write(sales, {'state': 'saved'})
+        moves = []
+        for sale in sales:
+            moves.extend(sale.create_shipment(shipment_type))
+            sale.set_number()
+        Move.do(moves)
+        Summary.add(sales)
+        Balance.add(sales)
 
     @classmethod
     @ModelView.button_action('nodux_sale_delivery_note.wizard_consolidate')
-    #@Workflow.transition('invoiced')
+    @locked
+    @Workflow.transition('invoiced')
     def consolidate(cls, sales):
-        Line = Pool().get('sale.delivery_line')
-        sale = sales[0]
+        pool = Pool()
+        Summary = pool.get('sale.delivery_summary')
+        Balance = pool.get('sale.delivery_party_balance')
+        Move = pool.get('stock.move')
         shipment_type = 'return'
-        sale.create_shipment(shipment_type)
-        cls.write(sales, {'state': 'invoiced'})
+        moves = []
+        for sale in sales:
+            moves.extend(sale.create_shipment(shipment_type))
+        Move.do(moves)
+        Summary.add(sales, invoiced=True)
+        Balance.add(sales, sign=-1)
+
+    @classmethod
+    def archive(cls, days=365, limit=10000):
+        '''
+        Move at most limit invoiced and anulled delivery notes older than
+        days to the archive tables, committing each batch so a run on a
+        large backlog does not hold its locks and undo in one transaction.
+        '''
+        pool = Pool()
+        Date = pool.get('ir.date')
+        Archive = pool.get('sale.delivery_archive')
+        cursor = Transaction().cursor
+
+        cutoff = Date.today() - timedelta(days=days)
+        with Transaction().set_user(0, set_context=True):
+            deliveries = cls.search([
+                    ('state', 'in', cls._states_cached),
+                    ['OR',
+                        ('delivery_date', '<', cutoff),
+                        [
+                            ('delivery_date', '=', None),
+                            ('create_date', '<',
+                                datetime.combine(cutoff, datetime.min.time())),
+                            ],
+                        ],
+                    ], order=[('id', 'ASC')], limit=limit)
+            for i in range(0, len(deliveries), cursor.IN_MAX):
+                Archive.archive(deliveries[i:i + cursor.IN_MAX])
+                cursor.commit()
 
+    @classmethod
+    @ModelView.button
+    @locked
+    @Workflow.transition('anulled')
+    def anull(cls, deliveries):
+        '''
+        Reverse the stock moves of saved deliveries, free their lots and
+        set them to anulled.
+        '''
+        pool = Pool()
+        Move = pool.get('stock.move')
+        Lot = pool.get('stock.lot')
+        Summary = pool.get('sale.delivery_summary')
+        Balance = pool.get('sale.delivery_party_balance')
+
+        to_create = []
+        lots = set()
+        for delivery in deliveries:
+            for line in delivery.lines:
+                for move in line.moves:
+                    if move.state != 'done':
+                        continue
+                    to_create.append(line._get_reverse_move(move))
+                    if move.lot:
+                        lots.add(move.lot)
+        if to_create:
+            Move.do(Move.create(to_create))
+        if lots:
+            Lot.write(list(lots), {'used_lot': 'no_used'})
+        Summary.add(deliveries, sign=-1)
+        Balance.add(deliveries, sign=-1)
+        cls.store_cache(deliveries)
+
+    @classmethod
+    def store_cache(cls, sales):
+        to_write = []
+        for sale in sales:
+            to_write.extend(([sale], {
+                        'untaxed_amount_cache': sale.untaxed_amount,
+                        'tax_amount_cache': sale.tax_amount,
+                        'total_amount_cache': sale.total_amount,
+                        }))
+        if to_write:
+            cls.write(*to_write)
 
     def create_shipment(self, shipment_type):
         return self.create_moves_without_shipment(shipment_type)
         return super(Delivery, self).create_shipment(shipment_type)
 
     def create_moves_without_shipment(self, shipment_type):
-        pool = Pool()
-        Move = pool.get('stock.move')
-        shipment_method = 'order'
-
-        #sale.create_shipment('return')
+        'Create the draft moves of the lines and return them'
         moves = self._get_move_sale_line(shipment_type)
-        to_create = []
-        for m in moves:
-            to_create.append(moves[m]._save_values)
-
-        Move.create(to_create)
-        Move.do(self.moves)
+        return [moves[l.id] for l in self.lines if l.id in moves]
 
     def _get_move_sale_line(self, shipment_type):
+        Line = Pool().get('sale.delivery_line')
         res = {}
+        dates = Line.get_delivery_date(self.lines, 'delivery_date')
         for line in self.lines:
-            val = line.get_move(shipment_type)
+            val = line.get_move(shipment_type, planned_date=dates[line.id])
             if val:
                 res[line.id] = val
         return res
@@ -455,7 +811,7 @@ class DeliveryLine(ModelSQL, ModelView):
     unit_digits = fields.Function(fields.Integer('Unit Digits'),
         'on_change_with_unit_digits')
     product = fields.Many2One('product.product', 'Product',
-        domain=[('salable', '=', True)],
+        domain=[('salable', '=', True)], select=True,
         states={
             'invisible': Eval('type') != 'line',
             'readonly': ~Eval('_parent_delivery', {}),
@@ -501,12 +857,12 @@ class DeliveryLine(ModelSQL, ModelView):
                         <= 0)),
                 },
             depends=['type', 'quantity']),
-        'on_change_with_delivery_date')
+        'get_delivery_date')
 
     product_type = fields.Function(fields.Char('Product Type'),
         'on_change_with_product_type')
 
-    lot = fields.Many2One('stock.lot', 'Lot',
+    lot = fields.Many2One('stock.lot', 'Lot', select=True,
         domain=[
             ('used_lot', '=', 'no_used'),
             ('product', '=', Eval('product')),
@@ -529,9 +885,23 @@ class DeliveryLine(ModelSQL, ModelView):
         super(DeliveryLine, cls).__setup__()
         cls._order.insert(0, ('sequence', 'ASC'))
 
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+
+        super(DeliveryLine, cls).__register__(module_name)
+
+        table = TableHandler(cursor, cls, module_name)
+        table.index_action(['delivery', 'sequence', 'id'], 'add')
+
     @staticmethod
     def order_sequence(tables):
         table, _ = tables[None]
+        if backend.name() == 'postgresql':
+            # PostgreSQL already sorts NULL as the greatest value, so the
+            # plain column keeps the (delivery, sequence, id) index usable
+            return [table.sequence]
         return [table.sequence == None, table.sequence]
 
     @staticmethod
@@ -566,6 +936,7 @@ class DeliveryLine(ModelSQL, ModelView):
     @fields.depends('product', 'unit', 'quantity', 'description',
         '_parent_delivery.party', '_parent_delivery.currency',
         '_parent_delivery.delivery_date')
+    @instrument('DeliveryLine.on_change_product')
     def on_change_product(self):
         Product = Pool().get('product.product')
 
@@ -663,11 +1034,29 @@ class DeliveryLine(ModelSQL, ModelView):
             return amount
         return Decimal('0.0')
 
-    def get_amount(self, name):
-        if self.type == 'line':
-            return self.on_change_with_amount()
-
-        return Decimal('0.0')
+    @classmethod
+    def get_amount(cls, lines, name):
+        amounts = {}
+        roundings = {}
+        to_compute = []
+        for line in lines:
+            if line.type != 'line':
+                amounts[line.id] = Decimal('0.0')
+            elif line.delivery and line.delivery.currency:
+                currency = line.delivery.currency
+                if currency.id not in roundings:
+                    roundings[currency.id] = minor_rounding(currency.rounding)
+                to_compute.append(line)
+            else:
+                amounts[line.id] = line.on_change_with_amount()
+        line_roundings = [roundings[l.delivery.currency.id]
+            for l in to_compute]
+        minor_amounts = line_amounts([l.quantity for l in to_compute],
+            [l.unit_price for l in to_compute], line_roundings)
+        for line, amount, (_, exponent) in zip(to_compute, minor_amounts,
+                line_roundings):
+            amounts[line.id] = from_minor(amount, exponent)
+        return amounts
 
     def get_warehouse(self, name):
         return self.delivery.warehouse.id if self.delivery.warehouse else None
@@ -692,7 +1081,74 @@ class DeliveryLine(ModelSQL, ModelView):
             date = self.delivery.delivery_date if self.delivery else None
             return self.product.compute_delivery_date(date=date)
 
-    def get_move(self, shipment_type):
+    @classmethod
+    def get_delivery_date(cls, lines, name):
+        '''
+        Compute the delivery date once for each distinct product and
+        delivery date of lines.
+        '''
+        dates = {}
+        result = {}
+        for line in lines:
+            result[line.id] = None
+            if not line.product or not line.quantity > 0:
+                continue
+            date = line.delivery.delivery_date if line.delivery else None
+            key = (line.product.id, date)
+            if key not in dates:
+                dates[key] = line.product.compute_delivery_date(date=date)
+            result[line.id] = dates[key]
+        return result
+
+    @classmethod
+    def trace_lots(cls, lots=None, products=None):
+        '''
+        Return the delivery note lines, including the archived ones, of
+        lots or products with their note, party, date and stock moves.
+        '''
+        pool = Pool()
+        Delivery = pool.get('sale.delivery')
+        Archive = pool.get('sale.delivery_archive')
+        ArchiveLine = pool.get('sale.delivery_line_archive')
+        Move = pool.get('stock.move')
+        cursor = Transaction().cursor
+
+        if lots:
+            column, ids = 'lot', [int(l) for l in lots]
+        elif products:
+            column, ids = 'product', [int(p) for p in products]
+        else:
+            return []
+
+        keys = ['delivery_model', 'delivery', 'number', 'party',
+            'delivery_date', 'state', 'line_model', 'line', 'product', 'lot',
+            'quantity', 'move', 'move_state']
+        result = []
+        for i in range(0, len(ids), cursor.IN_MAX):
+            sub_ids = ids[i:i + cursor.IN_MAX]
+            queries = []
+            for Model, Line in ((Delivery, cls), (Archive, ArchiveLine)):
+                delivery = Model.__table__()
+                line = Line.__table__()
+                move = Move.__table__()
+                queries.append(line.join(delivery,
+                        condition=line.delivery == delivery.id
+                        ).join(move, 'LEFT',
+                        condition=move.origin == Concat(
+                            Line.__name__ + ',', line.id)
+                        ).select(Literal(Model.__name__), delivery.id,
+                        delivery.number, delivery.party,
+                        delivery.delivery_date, delivery.state,
+                        Literal(Line.__name__), line.id, line.product,
+                        line.lot, line.quantity, move.id, move.state,
+                        where=Column(line, column).in_(sub_ids)))
+            cursor.execute(*Union(*queries, all_=True))
+            result.extend(dict(zip(keys, row)) for row in cursor.fetchall())
+        result.sort(key=lambda r: (r['delivery_date'], r['delivery'],
+                r['line'], r['move']), reverse=True)
+        return result
+
+    def get_move(self, shipment_type, planned_date=None):
         pool = Pool()
         Uom = pool.get('product.uom')
         Move = pool.get('stock.move')
@@ -745,10 +1201,30 @@ class DeliveryLine(ModelSQL, ModelView):
         move.company = self.delivery.company
         move.unit_price = self.unit_price
         move.currency = self.delivery.currency
-        move.planned_date = self.delivery_date
+        if planned_date is None:
+            planned_date = self.delivery_date
+        move.planned_date = planned_date
         move.origin = self
 
         move.save()
+        return move
+
+    def _get_reverse_move(self, move):
+        'Return the values of the move that reverses move'
+        Date = Pool().get('ir.date')
+        return {
+            'product': move.product.id,
+            'uom': move.uom.id,
+            'quantity': move.quantity,
+            'from_location': move.to_location.id,
+            'to_location': move.from_location.id,
+            'lot': move.lot.id if move.lot else None,
+            'company': move.company.id,
+            'unit_price': move.unit_price,
+            'currency': move.currency.id if move.currency else None,
+            'planned_date': Date.today(),
+            'origin': str(self),
+            }
 
 class DeliveryLineTax(ModelSQL):
     'Delivery Line - Tax'
@@ -809,6 +1285,46 @@ class DeliveryNoteReport(Report):
     __name__ = 'sale.delivery_report'
 
     @classmethod
+    def execute(cls, ids, data):
+        '''
+        Render the delivery notes in report_workers new Python processes
+        and merge the PDF files in order when report_workers is set in the
+        sale_delivery section of the configuration.
+        '''
+        pool = Pool()
+        ActionReport = pool.get('ir.action.report')
+        transaction = Transaction()
+
+        workers = config.getint('sale_delivery', 'report_workers', default=0)
+        if (workers < 2 or len(ids) < 2 or PdfFileMerger is None
+                or transaction.context.get('_delivery_report_worker')):
+            return super(DeliveryNoteReport, cls).execute(ids, data)
+        action_id = data.get('action_id')
+        if action_id is None:
+            action_report, = ActionReport.search([
+                    ('report_name', '=', cls.__name__),
+                    ], limit=1)
+        else:
+            action_report = ActionReport(action_id)
+        if action_report.extension != 'pdf':
+            return super(DeliveryNoteReport, cls).execute(ids, data)
+        cls.check_access()
+
+        contents = render_reports(transaction.cursor.database_name,
+            transaction.user, transaction.context, cls.__name__, ids, data,
+            min(workers, len(ids)))
+
+        merger = PdfFileMerger()
+        for content in contents:
+            merger.append(BytesIO(content))
+        output = BytesIO()
+        merger.write(output)
+        return ('pdf', buffer(output.getvalue()), action_report.direct_print,
+            action_report.name)
+
+    @classmethod
+    @instrument('DeliveryNoteReport.parse',
+        lambda cls, report, records, data, localcontext: len(records))
     def parse(cls, report, records, data, localcontext):
         pool = Pool()
         User = pool.get('res.user')
@@ -829,6 +1345,7 @@ class DeliveryNoteReport(Report):
 
         localcontext['company'] = user.company
         localcontext['delivery'] = delivery
+        localcontext['seller'] = cls._get_seller(delivery)
         localcontext['subtotal_0'] = cls._get_subtotal_0(Delivery, delivery)
         localcontext['subtotal_12'] = cls._get_subtotal_12(Delivery, delivery)
         localcontext['subtotal_14'] = cls._get_subtotal_14(Delivery, delivery)
@@ -838,6 +1355,11 @@ class DeliveryNoteReport(Report):
         return super(DeliveryNoteReport, cls).parse(report, records, data,
                 localcontext=localcontext)
 
+    @classmethod
+    def _get_seller(cls, delivery):
+        'Return the user who issued delivery'
+        return delivery.create_uid
+
     @classmethod
     def _get_amount_to_pay_words(cls, Delivery, delivery):
         amount_to_pay_words = ""
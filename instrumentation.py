@@ -0,0 +1,212 @@
+# This file is part of sale_pos module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+'''
+Low overhead instrumentation of the delivery note entry points.
+
+It is enabled in the sale_delivery section of the trytond configuration:
+
+    [sale_delivery]
+    instrument = True
+    # samples kept per entry point
+    instrument_samples = 1000
+    # number of slowest calls kept with their cProfile statistics
+    instrument_profile = 0
+    # file used by the dump cron, the log is used if not set
+    instrument_dump = /var/log/trytond/delivery_instrumentation.log
+'''
+import cProfile
+import heapq
+import logging
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from trytond.config import config
+from trytond.transaction import Transaction
+
+__all__ = ['instrument', 'measure', 'statistics', 'dump', 'reset']
+
+logger = logging.getLogger(__name__)
+
+_settings = {}
+_samples = {}
+_profiles = []
+_lock = threading.Lock()
+_local = threading.local()
+_sequence = [0]
+
+
+def _get_settings():
+    if not _settings:
+        _settings.update({
+                'enabled': config.getboolean('sale_delivery', 'instrument',
+                    default=False),
+                'samples': config.getint('sale_delivery',
+                    'instrument_samples', default=1000),
+                'profile': config.getint('sale_delivery',
+                    'instrument_profile', default=0),
+                'dump': config.get('sale_delivery', 'instrument_dump',
+                    default=None),
+                })
+    return _settings
+
+
+def _query_count():
+    'Return the number of queries executed by the transaction cursor'
+    cursor = Transaction().cursor
+    if cursor is None:
+        return 0
+    if not getattr(cursor, '_delivery_instrumented', False):
+        execute = cursor.execute
+
+        def counting_execute(*args, **kwargs):
+            _local.queries = getattr(_local, 'queries', 0) + 1
+            return execute(*args, **kwargs)
+        cursor.execute = counting_execute
+        cursor._delivery_instrumented = True
+    return getattr(_local, 'queries', 0)
+
+
+def _record(name, wall, queries, items, profile):
+    settings = _get_settings()
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = deque(maxlen=settings['samples'])
+        samples.append((wall, queries, items))
+        if not profile:
+            return
+        if (len(_profiles) >= settings['profile']
+                and wall <= _profiles[0][0]):
+            return
+    output = StringIO()
+    pstats.Stats(profile, stream=output).sort_stats('cumulative'
+        ).print_stats(30)
+    with _lock:
+        _sequence[0] += 1
+        entry = (wall, _sequence[0], name, output.getvalue())
+        if len(_profiles) < settings['profile']:
+            heapq.heappush(_profiles, entry)
+        elif wall > _profiles[0][0]:
+            heapq.heapreplace(_profiles, entry)
+
+
+@contextmanager
+def measure(name, items=1):
+    '''
+    Record the wall time, the number of queries and the number of items of
+    the block under name.
+    '''
+    settings = _get_settings()
+    if not settings['enabled']:
+        yield
+        return
+    depth = getattr(_local, 'depth', 0)
+    queries = _query_count()
+    profile = None
+    if settings['profile'] and not depth:
+        profile = cProfile.Profile()
+    _local.depth = depth + 1
+    start = time.time()
+    if profile:
+        profile.enable()
+    try:
+        yield
+    finally:
+        if profile:
+            profile.disable()
+        wall = time.time() - start
+        _local.depth = depth
+        _record(name, wall, _query_count() - queries, items, profile)
+
+
+def instrument(name, count=None):
+    '''
+    Record the wall time, the number of queries and the number of items
+    returned by count(*args, **kwargs) of each call of the decorated
+    function under name.
+    The wrapper hides the signature of the function, so the methods
+    inspected by Tryton, like Function field getters, must use measure.
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _get_settings()['enabled']:
+                return func(*args, **kwargs)
+            items = count(*args, **kwargs) if count else 1
+            with measure(name, items):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100.))]
+
+
+def statistics():
+    'Return the statistics of the samples of each entry point'
+    with _lock:
+        samples = dict((n, list(s)) for n, s in _samples.items())
+    result = {}
+    for name, values in samples.items():
+        walls = sorted(v[0] for v in values)
+        result[name] = {
+            'calls': len(values),
+            'wall_mean': sum(walls) / len(walls),
+            'wall_p50': _percentile(walls, 50),
+            'wall_p90': _percentile(walls, 90),
+            'wall_p99': _percentile(walls, 99),
+            'wall_max': walls[-1],
+            'queries_mean': float(sum(v[1] for v in values)) / len(values),
+            'queries_max': max(v[1] for v in values),
+            'items_mean': float(sum(v[2] for v in values)) / len(values),
+            'items_max': max(v[2] for v in values),
+            }
+    return result
+
+
+def dump(filename=None):
+    '''
+    Write the statistics and the profiles of the slowest calls to filename
+    or to the log.
+    '''
+    lines = []
+    for name, stats in sorted(statistics().items()):
+        lines.append('%s: %d calls, wall mean %.1fms p50 %.1fms '
+            'p90 %.1fms p99 %.1fms max %.1fms, queries mean %.1f max %d, '
+            'items mean %.1f max %d' % (name, stats['calls'],
+                stats['wall_mean'] * 1000, stats['wall_p50'] * 1000,
+                stats['wall_p90'] * 1000, stats['wall_p99'] * 1000,
+                stats['wall_max'] * 1000, stats['queries_mean'],
+                stats['queries_max'], stats['items_mean'],
+                stats['items_max']))
+    with _lock:
+        profiles = sorted(_profiles, reverse=True)
+    for wall, _, name, text in profiles:
+        lines.append('Profile of %s (%.1fms)' % (name, wall * 1000))
+        lines.append(text)
+    text = '\n'.join(lines)
+    if filename:
+        with open(filename, 'a') as output:
+            output.write(time.strftime('%Y-%m-%d %H:%M:%S\n'))
+            output.write(text + '\n')
+    else:
+        for line in lines:
+            logger.info(line)
+    return text
+
+
+def reset():
+    'Drop the samples and the profiles'
+    with _lock:
+        _samples.clear()
+        del _profiles[:]
@@ -10,7 +10,8 @@ class Move:
 
     @staticmethod
     def _get_origin():
-        return ['stock.inventory.line', 'sale.delivery_line', 'sale.line']
+        return ['stock.inventory.line', 'sale.delivery_line',
+            'sale.delivery_line_archive', 'sale.line']
 
     @classmethod
     def get_origin(cls):
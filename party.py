@@ -0,0 +1,175 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from decimal import Decimal
+
+from sql.conditionals import Coalesce
+from sql.functions import CurrentTimestamp
+
+from trytond import backend
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.model.fields.field import SQL_OPERATORS
+from trytond.pool import PoolMeta, Pool
+from trytond.pyson import Eval
+from trytond.transaction import Transaction
+
+from .delivery import create_index, has_trigram, insert_or_retry
+
+__all__ = ['DeliveryPartyBalance', 'Party']
+__metaclass__ = PoolMeta
+
+_ZERO = Decimal(0)
+
+
+class DeliveryPartyBalance(ModelSQL, ModelView):
+    'Delivery Party Balance'
+    __name__ = 'sale.delivery_party_balance'
+
+    company = fields.Many2One('company.company', 'Company', readonly=True,
+        required=True)
+    party = fields.Many2One('party.party', 'Party', readonly=True,
+        required=True)
+    currency_digits = fields.Function(fields.Integer('Currency Digits'),
+        'get_currency_digits')
+    amount = fields.Numeric('Amount', digits=(16, Eval('currency_digits', 2)),
+        readonly=True, depends=['currency_digits'],
+        help="Total of the saved delivery notes in company currency")
+
+    @classmethod
+    def __setup__(cls):
+        super(DeliveryPartyBalance, cls).__setup__()
+        cls._sql_constraints += [
+            ('company_party_uniq', 'UNIQUE(company, party)',
+                'There can be only one balance per company and party.'),
+            ]
+
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+        created = not TableHandler.table_exist(cursor, cls._table)
+
+        super(DeliveryPartyBalance, cls).__register__(module_name)
+
+        # The notes saved before the upgrade must be in the balances before
+        # they are consolidated or anulled
+        if created:
+            cls.rebuild()
+
+    def get_currency_digits(self, name):
+        return self.company.currency.digits
+
+    @classmethod
+    def add(cls, deliveries, sign=1):
+        '''
+        Add the total amount of deliveries to the balances, times sign.
+        The amounts are converted at the rate of the delivery date, so the
+        same note always adds and removes the same amount.
+        '''
+        Currency = Pool().get('currency.currency')
+
+        values = {}
+        for delivery in deliveries:
+            key = (delivery.company.id, delivery.party.id)
+            date = delivery.delivery_date or delivery.create_date.date()
+            with Transaction().set_context(date=date):
+                amount = Currency.compute(delivery.currency,
+                    delivery.total_amount, delivery.company.currency)
+            values[key] = values.get(key, _ZERO) + sign * amount
+        cls._update(values)
+
+    @classmethod
+    def _update(cls, values):
+        '''
+        Increment the balances of values keys, creating missing ones.
+        A balance created meanwhile by a concurrent transaction violates
+        company_party_uniq and the request is retried.
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        for (company, party), amount in values.iteritems():
+            if not amount:
+                continue
+            cursor.execute(*table.select(table.id,
+                    where=(table.company == company)
+                    & (table.party == party)))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute(*table.update([table.amount],
+                        [table.amount + amount],
+                        where=table.id == row[0]))
+            else:
+                insert_or_retry(cursor, table.insert([table.company,
+                            table.party, table.amount, table.create_uid,
+                            table.create_date],
+                        [[company, party, amount, Transaction().user,
+                                CurrentTimestamp()]]))
+
+    @classmethod
+    def rebuild(cls):
+        'Recompute the balances from the saved delivery notes'
+        Delivery = Pool().get('sale.delivery')
+        cursor = Transaction().cursor
+
+        cursor.execute(*cls.__table__().delete())
+        deliveries = Delivery.search([
+                ('state', '=', 'saved'),
+                ], order=[('id', 'ASC')])
+        for i in range(0, len(deliveries), cursor.IN_MAX):
+            cls.add(deliveries[i:i + cursor.IN_MAX])
+
+
+class Party:
+    __name__ = 'party.party'
+    delivery_balance = fields.Function(fields.Numeric('Delivery Balance',
+            digits=(16, Eval('currency_digits', 2)),
+            depends=['currency_digits'],
+            help="Value of the goods delivered but not yet invoiced"),
+        'get_delivery_balance', searcher='search_delivery_balance')
+
+    @classmethod
+    def __register__(cls, module_name):
+        cursor = Transaction().cursor
+
+        super(Party, cls).__register__(module_name)
+
+        # Used by the substring search of sale.delivery rec_name
+        if backend.name() == 'postgresql' and has_trigram(cursor):
+            create_index(cursor, cls._table + '_name_trgm_index',
+                cls._table, 'USING gin (name gin_trgm_ops)')
+
+    @classmethod
+    def get_delivery_balance(cls, parties, name):
+        Balance = Pool().get('sale.delivery_party_balance')
+        balance = Balance.__table__()
+        cursor = Transaction().cursor
+
+        result = dict((p.id, _ZERO) for p in parties)
+        company_id = Transaction().context.get('company')
+        if not company_id:
+            return result
+        ids = [p.id for p in parties]
+        for i in range(0, len(ids), cursor.IN_MAX):
+            sub_ids = ids[i:i + cursor.IN_MAX]
+            cursor.execute(*balance.select(balance.party, balance.amount,
+                    where=(balance.company == company_id)
+                    & balance.party.in_(sub_ids)))
+            result.update(cursor.fetchall())
+        return result
+
+    @classmethod
+    def search_delivery_balance(cls, name, clause):
+        Balance = Pool().get('sale.delivery_party_balance')
+        party = cls.__table__()
+        balance = Balance.__table__()
+
+        company_id = Transaction().context.get('company')
+        _, operator, value = clause
+        Operator = SQL_OPERATORS[operator]
+        query = party.join(balance, 'LEFT',
+            condition=(balance.party == party.id)
+            & (balance.company == company_id)
+            ).select(party.id,
+                where=Operator(Coalesce(balance.amount, _ZERO),
+                    Decimal(str(value or 0))))
+        return [('id', 'in', query)]
@@ -0,0 +1,110 @@
+# This file is part of sale_pos module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+'''
+Render delivery note reports in separate Python processes.
+
+The workers are new interpreters running this file instead of forks of the
+server, so they inherit neither the transaction nor the database
+connections of the request. Each worker reads the pickled configuration,
+path and report request on its standard input, loads the pool of the
+database and writes the PDF of its notes, merged in order, on its standard
+output.
+'''
+import logging
+import os
+import subprocess
+import sys
+from io import BytesIO
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+__all__ = ['render_reports']
+
+
+def render_reports(database_name, user, context, report_name, ids, data,
+        processes):
+    '''
+    Render the report of each id in processes workers and return the PDF
+    of each worker in the order of ids.
+    '''
+    from trytond.config import config
+
+    configuration = StringIO()
+    config.write(configuration)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'report_worker.py')
+    size = -(-len(ids) // processes)
+    workers = []
+    try:
+        for i in range(0, len(ids), size):
+            worker = subprocess.Popen([sys.executable, script],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+            workers.append(worker)
+            pickle.dump({
+                    'config': configuration.getvalue(),
+                    'path': sys.path,
+                    'database_name': database_name,
+                    'user': user,
+                    'context': context,
+                    'report_name': report_name,
+                    'ids': ids[i:i + size],
+                    'data': data,
+                    }, worker.stdin, pickle.HIGHEST_PROTOCOL)
+            worker.stdin.close()
+        contents = []
+        for worker in workers:
+            content = worker.stdout.read()
+            if worker.wait():
+                raise Exception('Error', 'Report worker of %s exited with '
+                    'status %s' % (report_name, worker.returncode))
+            contents.append(content)
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+                worker.wait()
+    return contents
+
+
+def main():
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    request = pickle.load(stdin)
+    # Keep the PDF stream clean of anything printed by the modules
+    output = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    logging.basicConfig(level=logging.WARNING)
+
+    sys.path[:] = request['path']
+    from trytond.config import config
+    config.readfp(StringIO(request['config']))
+    from trytond.pool import Pool
+    from trytond.transaction import Transaction
+    from PyPDF2 import PdfFileMerger
+
+    database_name = request['database_name']
+    Pool.start()
+    pool = Pool(database_name)
+    pool.init()
+    context = dict(request['context'], _delivery_report_worker=True)
+    merger = PdfFileMerger()
+    with Transaction().start(database_name, request['user'], readonly=True,
+            context=context):
+        Report = pool.get(request['report_name'], type='report')
+        for id_ in request['ids']:
+            _, content, _, _ = Report.execute([id_], request['data'])
+            merger.append(BytesIO(bytes(content)))
+    content = BytesIO()
+    merger.write(content)
+    output.write(content.getvalue())
+    output.close()
+
+
+if __name__ == '__main__':
+    main()
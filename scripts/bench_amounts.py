@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# This file is part of sale_pos module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+"""
+Compare the Decimal computation of delivery line amounts and note totals
+with the integer minor unit path of the amount module.
+
+    python bench_amounts.py --lines 100000 --notes 1000
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal, ROUND_HALF_EVEN
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from amount import minor_rounding, line_amounts, sum_amounts, from_minor
+
+_ZERO = Decimal(0)
+
+
+def currency_round(amount, rounding):
+    'Same as currency.currency.round'
+    return (amount / rounding).quantize(Decimal('1.'),
+        rounding=ROUND_HALF_EVEN) * rounding
+
+
+def decimal_totals(deliveries, quantities, unit_prices, roundings):
+    totals = {}
+    for delivery, quantity, unit_price in zip(deliveries, quantities,
+            unit_prices):
+        amount = currency_round(Decimal(str(quantity or '0.0'))
+            * (unit_price or Decimal('0.0')), roundings[delivery])
+        totals[delivery] = totals.get(delivery, _ZERO) + amount
+    return totals
+
+
+def minor_totals(deliveries, quantities, unit_prices, roundings):
+    minor_roundings = [minor_rounding(r) for r in roundings]
+    amounts = line_amounts(quantities, unit_prices,
+        [minor_roundings[d] for d in deliveries])
+    return dict((d, from_minor(a, minor_roundings[d][1]))
+        for d, a in sum_amounts(deliveries, amounts).items())
+
+
+def generate(lines, notes, seed):
+    rand = random.Random(seed)
+    roundings = [Decimal('0.01'), Decimal('0.05'), Decimal('1')]
+    note_roundings = [rand.choice(roundings) for _ in range(notes)]
+    deliveries, quantities, unit_prices = [], [], []
+    for _ in range(lines):
+        deliveries.append(rand.randrange(notes))
+        quantities.append(rand.choice([
+                    float(rand.randint(-5, 50)),
+                    round(rand.uniform(-5, 50), 3),
+                    ]))
+        unit_prices.append(Decimal(rand.randint(0, 10 ** 7)).scaleb(-4))
+    return deliveries, quantities, unit_prices, note_roundings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=100000)
+    parser.add_argument('--notes', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+
+    args = generate(options.lines, options.notes, options.seed)
+    expected = decimal_totals(*args)
+    result = minor_totals(*args)
+    assert expected == result, 'totals differ'
+    assert all(str(expected[k]) == str(result[k]) for k in expected), \
+        'representations differ'
+
+    decimal_time = min(timeit.repeat(lambda: decimal_totals(*args),
+            number=1, repeat=options.repeat))
+    minor_time = min(timeit.repeat(lambda: minor_totals(*args),
+            number=1, repeat=options.repeat))
+    print('%d lines, %d notes: totals identical' % (
+            options.lines, options.notes))
+    print('Decimal:     %.3fs' % decimal_time)
+    print('Minor units: %.3fs' % minor_time)
+    print('Speedup:     %.1fx' % (decimal_time / minor_time))
+
+
+if __name__ == '__main__':
+    main()
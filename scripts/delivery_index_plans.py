@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# This file is part of sale_pos module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+"""
+Show the PostgreSQL query plans of the delivery note hot queries before
+and after the composite indexes created by the module.
+
+The dataset is generated in temporary tables, so the script can be run
+against any database:
+
+    python delivery_index_plans.py "dbname=test" --notes 200000
+"""
+from __future__ import print_function
+
+import argparse
+
+import psycopg2
+
+SCHEMA = [
+    '''CREATE TEMPORARY TABLE sale_delivery (
+        id SERIAL PRIMARY KEY,
+        company INTEGER NOT NULL,
+        party INTEGER NOT NULL,
+        shop INTEGER,
+        state VARCHAR NOT NULL,
+        number VARCHAR,
+        delivery_date DATE)''',
+    '''CREATE TEMPORARY TABLE sale_delivery_line (
+        id SERIAL PRIMARY KEY,
+        delivery INTEGER NOT NULL,
+        sequence INTEGER,
+        quantity DOUBLE PRECISION,
+        unit_price NUMERIC)''',
+    # Indexes already created by select=True
+    'CREATE INDEX sale_delivery_company_index ON sale_delivery (company)',
+    'CREATE INDEX sale_delivery_party_index ON sale_delivery (party)',
+    'CREATE INDEX sale_delivery_line_delivery_index '
+    'ON sale_delivery_line (delivery)',
+    ]
+
+DATASET = [
+    '''INSERT INTO sale_delivery
+        (company, party, shop, state, number, delivery_date)
+        SELECT 1 + i %% 2, 1 + i %% %(parties)s, 1 + i %% 2,
+            (ARRAY['draft', 'saved', 'invoiced', 'invoiced', 'invoiced',
+                'anulled'])[1 + i %% 6],
+            CASE WHEN i %% 6 = 0 THEN NULL ELSE lpad(i::text, 9, '0') END,
+            DATE '2010-01-01' + (i %% 3000)
+        FROM generate_series(1, %(notes)s) AS i''',
+    '''INSERT INTO sale_delivery_line
+        (delivery, sequence, quantity, unit_price)
+        SELECT d.id, s, s, 1.5
+        FROM sale_delivery AS d, generate_series(1, %(lines)s) AS s''',
+    'ANALYZE sale_delivery',
+    'ANALYZE sale_delivery_line',
+    ]
+
+INDEXES = [
+    'CREATE INDEX sale_delivery_company_state_delivery_date_index '
+    'ON sale_delivery (company, state, delivery_date)',
+    'CREATE INDEX sale_delivery_party_state_index '
+    'ON sale_delivery (party, state)',
+    'CREATE UNIQUE INDEX sale_delivery_number_shop_uniq '
+    'ON sale_delivery (company, number, shop)',
+    'CREATE INDEX sale_delivery_line_delivery_sequence_id_index '
+    'ON sale_delivery_line (delivery, sequence, id)',
+    'ANALYZE sale_delivery',
+    'ANALYZE sale_delivery_line',
+    ]
+
+QUERIES = [
+    ('Saved tab of the delivery notes',
+        '''SELECT id FROM sale_delivery
+        WHERE company = 2 AND state = 'saved'
+        ORDER BY delivery_date DESC LIMIT 80'''),
+    ('Saved notes of a party',
+        '''SELECT id FROM sale_delivery
+        WHERE party = 42 AND state = 'saved' '''),
+    ('Note by number',
+        '''SELECT id FROM sale_delivery
+        WHERE company = 1 AND number = '000001235' '''),
+    ('Lines of a note in sequence order',
+        '''SELECT id FROM sale_delivery_line
+        WHERE delivery = 1234
+        ORDER BY sequence, id'''),
+    ]
+
+
+def explain(cursor, title):
+    print('=' * 72)
+    print(title)
+    for name, query in QUERIES:
+        print('-' * 72)
+        print(name)
+        cursor.execute('EXPLAIN ANALYZE ' + query)
+        for line, in cursor.fetchall():
+            print('    ' + line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dsn', help='libpq connection string')
+    parser.add_argument('--notes', type=int, default=100000)
+    parser.add_argument('--lines', type=int, default=5,
+        help='lines per note')
+    parser.add_argument('--parties', type=int, default=5000)
+    options = parser.parse_args()
+
+    connection = psycopg2.connect(options.dsn)
+    try:
+        cursor = connection.cursor()
+        for query in SCHEMA:
+            cursor.execute(query)
+        for query in DATASET:
+            cursor.execute(query, {
+                    'notes': options.notes,
+                    'lines': options.lines,
+                    'parties': options.parties,
+                    })
+        explain(cursor, 'Before')
+        for query in INDEXES:
+            cursor.execute(query)
+        explain(cursor, 'After')
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
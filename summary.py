@@ -0,0 +1,222 @@
+# This file is part of sale_pos module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+from decimal import Decimal
+
+from sql.aggregate import Count, Min, Sum
+from sql.conditionals import Coalesce
+from sql.functions import CurrentTimestamp
+
+from trytond import backend
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.pool import Pool
+from trytond.pyson import Eval
+from trytond.transaction import Transaction
+from trytond.wizard import Wizard, StateTransition
+
+from .delivery import create_index, insert_or_retry
+
+__all__ = ['DeliverySummary', 'DeliverySummaryRebuild']
+
+_ZERO = Decimal(0)
+
+
+class DeliverySummary(ModelSQL, ModelView):
+    'Delivery Summary'
+    __name__ = 'sale.delivery_summary'
+
+    date = fields.Date('Date', readonly=True, select=True)
+    company = fields.Many2One('company.company', 'Company', readonly=True,
+        select=True)
+    shop = fields.Many2One('sale.shop', 'Shop', readonly=True)
+    party = fields.Many2One('party.party', 'Party', readonly=True,
+        select=True)
+    product = fields.Many2One('product.product', 'Product', readonly=True,
+        select=True)
+    lot = fields.Many2One('stock.lot', 'Lot', readonly=True)
+    currency = fields.Many2One('currency.currency', 'Currency', readonly=True)
+    currency_digits = fields.Function(fields.Integer('Currency Digits'),
+        'on_change_with_currency_digits')
+    quantity = fields.Float('Quantity', readonly=True,
+        help="Quantity delivered in the default unit of the product")
+    amount = fields.Numeric('Amount',
+        digits=(16, Eval('currency_digits', 2)), readonly=True,
+        depends=['currency_digits'])
+    invoiced_quantity = fields.Float('Invoiced Quantity', readonly=True)
+    invoiced_amount = fields.Numeric('Invoiced Amount',
+        digits=(16, Eval('currency_digits', 2)), readonly=True,
+        depends=['currency_digits'])
+
+    @classmethod
+    def __setup__(cls):
+        super(DeliverySummary, cls).__setup__()
+        cls._order.insert(0, ('date', 'DESC'))
+
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+        created = not TableHandler.table_exist(cursor, cls._table)
+
+        super(DeliverySummary, cls).__register__(module_name)
+
+        table = TableHandler(cursor, cls, module_name)
+        table.index_action(['company', 'date', 'product'], 'add')
+        table.index_action(['product', 'lot'], 'add')
+
+        if backend.name() == 'postgresql':
+            # NULL shop or lot must not allow duplicate keys
+            cls._merge_duplicates()
+            create_index(cursor, cls._table + '_key_uniq', cls._table,
+                '(date, company, COALESCE(shop, 0), party, product, '
+                'COALESCE(lot, 0), currency)', unique=True)
+
+        # The notes saved before the upgrade must be in the summary before
+        # they are consolidated or anulled
+        if created:
+            cls.rebuild()
+
+    @classmethod
+    def _merge_duplicates(cls):
+        'Merge the rows sharing the same key into the one with the lowest id'
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        key_columns = [table.date, table.company, Coalesce(table.shop, 0),
+            table.party, table.product, Coalesce(table.lot, 0),
+            table.currency]
+        value_columns = [table.quantity, table.amount,
+            table.invoiced_quantity, table.invoiced_amount]
+        cursor.execute(*table.select(*([Min(table.id)]
+                    + [Sum(c) for c in value_columns] + key_columns),
+                group_by=key_columns,
+                having=Count(table.id) > 1))
+        for row in cursor.fetchall():
+            id_, values, key = row[0], row[1:5], row[5:]
+            cursor.execute(*table.update(value_columns, list(values),
+                    where=table.id == id_))
+            where = table.id != id_
+            for column, value in zip(key_columns, key):
+                where &= column == value
+            cursor.execute(*table.delete(where=where))
+
+    @fields.depends('currency')
+    def on_change_with_currency_digits(self, name=None):
+        if self.currency:
+            return self.currency.digits
+        return 2
+
+    @staticmethod
+    def _get_key(delivery, line):
+        'Return the summary key of the delivery line'
+        Date = Pool().get('ir.date')
+        return (
+            delivery.delivery_date or Date.today(),
+            delivery.company.id,
+            delivery.shop.id if delivery.shop else None,
+            delivery.party.id,
+            line.product.id,
+            line.lot.id if line.lot else None,
+            delivery.currency.id,
+            )
+
+    @classmethod
+    def add(cls, deliveries, sign=1, invoiced=False):
+        '''
+        Add the lines of deliveries to the summary, multiplied by sign.
+        The invoiced columns are updated instead if invoiced is set.
+        '''
+        Uom = Pool().get('product.uom')
+
+        values = {}
+        for delivery in deliveries:
+            for line in delivery.lines:
+                if line.type != 'line' or not line.product:
+                    continue
+                key = cls._get_key(delivery, line)
+                quantity = line.quantity or 0.0
+                if line.unit and line.unit != line.product.default_uom:
+                    quantity = Uom.compute_qty(line.unit, quantity,
+                        line.product.default_uom)
+                old_quantity, old_amount = values.get(key, (0.0, _ZERO))
+                values[key] = (old_quantity + sign * quantity,
+                    old_amount + sign * (line.amount or _ZERO))
+        cls._update(values, invoiced)
+
+    @classmethod
+    def _update(cls, values, invoiced=False):
+        '''
+        Increment the summary rows of values keys, creating missing ones.
+        A row created meanwhile by a concurrent transaction violates the
+        key index and the request is retried.
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        if invoiced:
+            quantity_column = table.invoiced_quantity
+            amount_column = table.invoiced_amount
+        else:
+            quantity_column = table.quantity
+            amount_column = table.amount
+        key_columns = [table.date, table.company, table.shop, table.party,
+            table.product, table.lot, table.currency]
+
+        for key, (quantity, amount) in values.iteritems():
+            where = None
+            for column, value in zip(key_columns, key):
+                clause = column == value
+                where = clause if where is None else where & clause
+            cursor.execute(*table.select(table.id, where=where, limit=1))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute(*table.update(
+                        [quantity_column, amount_column],
+                        [quantity_column + quantity, amount_column + amount],
+                        where=table.id == row[0]))
+            else:
+                if invoiced:
+                    quantities = [0.0, _ZERO, quantity, amount]
+                else:
+                    quantities = [quantity, amount, 0.0, _ZERO]
+                insert_or_retry(cursor, table.insert(
+                        key_columns + [table.quantity, table.amount,
+                            table.invoiced_quantity, table.invoiced_amount,
+                            table.create_uid, table.create_date],
+                        [list(key) + quantities + [Transaction().user,
+                                CurrentTimestamp()]]))
+
+    @classmethod
+    def rebuild(cls):
+        'Recompute the summary from the saved and invoiced delivery notes'
+        pool = Pool()
+        Delivery = pool.get('sale.delivery')
+        Archive = pool.get('sale.delivery_archive')
+        cursor = Transaction().cursor
+
+        cursor.execute(*cls.__table__().delete())
+        for Model, states in ((Delivery, ['saved', 'invoiced']),
+                (Archive, ['invoiced'])):
+            deliveries = Model.search([
+                    ('state', 'in', states),
+                    ], order=[('id', 'ASC')])
+            for i in range(0, len(deliveries), cursor.IN_MAX):
+                sub_deliveries = deliveries[i:i + cursor.IN_MAX]
+                cls.add(sub_deliveries)
+                cls.add([d for d in sub_deliveries if d.state == 'invoiced'],
+                    invoiced=True)
+
+
+class DeliverySummaryRebuild(Wizard):
+    'Rebuild Delivery Summary'
+    __name__ = 'sale.delivery_summary_rebuild'
+    start_state = 'rebuild'
+    rebuild = StateTransition()
+
+    def transition_rebuild(self):
+        pool = Pool()
+        Summary = pool.get('sale.delivery_summary')
+        Balance = pool.get('sale.delivery_party_balance')
+        Summary.rebuild()
+        Balance.rebuild()
+        return 'end'
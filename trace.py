@@ -0,0 +1,101 @@
+# This file is part of sale_pos module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+from trytond.model import ModelView, fields
+from trytond.pool import Pool
+from trytond.pyson import Bool, Eval
+from trytond.transaction import Transaction
+from trytond.wizard import Wizard, StateView, Button
+
+__all__ = ['DeliveryTraceStart', 'DeliveryTraceLine', 'DeliveryTraceResult',
+    'DeliveryTrace']
+
+
+class DeliveryTraceStart(ModelView):
+    'Delivery Trace Start'
+    __name__ = 'sale.delivery_trace_start'
+    lots = fields.Many2Many('stock.lot', None, None, 'Lots')
+    products = fields.Many2Many('product.product', None, None, 'Products',
+        states={
+            'invisible': Bool(Eval('lots')),
+            },
+        depends=['lots'],
+        help="Used when no lot is selected")
+
+
+class DeliveryTraceLine(ModelView):
+    'Delivery Trace Line'
+    __name__ = 'sale.delivery_trace_line'
+    delivery = fields.Reference('Delivery', selection=[
+            ('sale.delivery', 'Delivery Note'),
+            ('sale.delivery_archive', 'Archived Delivery Note'),
+            ], readonly=True)
+    number = fields.Char('Number', readonly=True)
+    party = fields.Many2One('party.party', 'Party', readonly=True)
+    delivery_date = fields.Date('Date', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('saved', 'Saved'),
+        ('anulled', 'Anulled'),
+        ('invoiced', 'Invoiced'),
+    ], 'State', readonly=True)
+    product = fields.Many2One('product.product', 'Product', readonly=True)
+    lot = fields.Many2One('stock.lot', 'Lot', readonly=True)
+    quantity = fields.Float('Quantity', readonly=True)
+    move = fields.Many2One('stock.move', 'Move', readonly=True)
+    move_state = fields.Selection([
+        (None, ''),
+        ('staging', 'Staging'),
+        ('draft', 'Draft'),
+        ('assigned', 'Assigned'),
+        ('done', 'Done'),
+        ('cancel', 'Canceled'),
+    ], 'Move State', readonly=True)
+
+
+class DeliveryTraceResult(ModelView):
+    'Delivery Trace Result'
+    __name__ = 'sale.delivery_trace_result'
+    lines = fields.One2Many('sale.delivery_trace_line', None, 'Lines',
+        readonly=True)
+
+
+class DeliveryTrace(Wizard):
+    'Delivery Trace'
+    __name__ = 'sale.delivery_trace'
+    start = StateView('sale.delivery_trace_start',
+        'nodux_sale_delivery_note.delivery_trace_start_view_form', [
+            Button('Cancel', 'end', 'tryton-cancel'),
+            Button('Trace', 'result', 'tryton-ok', default=True),
+            ])
+    result = StateView('sale.delivery_trace_result',
+        'nodux_sale_delivery_note.delivery_trace_result_view_form', [
+            Button('Close', 'end', 'tryton-close', default=True),
+            ])
+
+    def default_start(self, fields):
+        context = Transaction().context
+        if context.get('active_model') == 'stock.lot':
+            return {'lots': context.get('active_ids', [])}
+        return {}
+
+    def default_result(self, fields):
+        Line = Pool().get('sale.delivery_line')
+        rows = Line.trace_lots(lots=self.start.lots,
+            products=self.start.products)
+        lines = []
+        for row in rows:
+            lines.append({
+                    'delivery': '%s,%s' % (row['delivery_model'],
+                        row['delivery']),
+                    'number': row['number'],
+                    'party': row['party'],
+                    'delivery_date': row['delivery_date'],
+                    'state': row['state'],
+                    'product': row['product'],
+                    'lot': row['lot'],
+                    'quantity': row['quantity'],
+                    'move': row['move'],
+                    'move_state': row['move_state'],
+                    })
+        return {'lines': lines}